@@ -0,0 +1,70 @@
+"""
+Compare turn latency of sequential and batched code execution.
+A fake function runner that sleeps for each request stands in for the real sandbox.
+
+Run from bot/:
+    python -m benchmarks.function_runner_benchmark
+"""
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RUNNER_LATENCY_SECONDS = 0.5
+RUNNER_PORTS = [18081, 18082]
+CELLS = 8
+MAX_CONCURRENT_RUNS = 4
+
+os.environ["FUNCTION_RUNNER_URLS"] = ",".join(f"http://localhost:{port}" for port in RUNNER_PORTS)
+
+from custom_interpreter.function_runner import (  # noqa: E402
+    call_function_runner,
+    call_function_runners,
+    merge_cell_outputs,
+    split_code_cells,
+)
+
+
+class FakeRunnerHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(RUNNER_LATENCY_SECONDS)
+        content = json.dumps({"role": "function", "name": "run_code", "content": body["code"]}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fake_runners():
+    for port in RUNNER_PORTS:
+        server = ThreadingHTTPServer(("localhost", port), FakeRunnerHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+
+def main():
+    start_fake_runners()
+    code = "\n# %%\n".join(f"print({i})" for i in range(CELLS))
+    cells = split_code_cells(code)
+
+    start = time.perf_counter()
+    sequential_outputs = [call_function_runner(cell, "python") for cell in cells]
+    sequential_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    batched_outputs = call_function_runners(cells, "python", MAX_CONCURRENT_RUNS)
+    batched_seconds = time.perf_counter() - start
+
+    assert merge_cell_outputs(sequential_outputs) == merge_cell_outputs(batched_outputs)
+    print(f"cells: {len(cells)}, runner latency: {RUNNER_LATENCY_SECONDS}s, max concurrency: {MAX_CONCURRENT_RUNS}")
+    print(f"sequential: {sequential_seconds:.2f}s")
+    print(f"batched:    {batched_seconds:.2f}s ({sequential_seconds / batched_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Replay a 20k-chunk LLM stream through merge_deltas and StreamAccumulator.
+Pass a JSON lines file of recorded chunks to replay it instead of the generated stream.
+
+Run from bot/:
+    python -m benchmarks.stream_accumulator_benchmark [recorded_chunks.jsonl]
+"""
+import json
+import sys
+import time
+from typing import List
+
+from interpreter.utils.merge_deltas import merge_deltas
+
+from custom_interpreter.stream_accumulator import StreamAccumulator
+
+CHUNKS = 20000
+
+
+def generate_chunks() -> List[dict]:
+    """
+    Generate a stream shaped like the coding LLM's: a short message, then a long code block
+    """
+    message_chunks = [{"message": f"token{i} "} for i in range(CHUNKS // 10)]
+    code_chunks = [
+        {"code": f"x_{i} = {i}\n" if i % 8 == 0 else f"v{i} "}
+        for i in range(CHUNKS - len(message_chunks) - 1)
+    ]
+    return message_chunks + [{"language": "python"}] + code_chunks
+
+
+def load_chunks(file_path: str) -> List[dict]:
+    with open(file_path, "r") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def replay_merge_deltas(chunks: List[dict]) -> dict:
+    messages = [{"role": "assistant"}]
+    for chunk in chunks:
+        messages[-1] = merge_deltas(messages[-1], chunk)
+    return messages[-1]
+
+
+def replay_accumulator(chunks: List[dict]) -> dict:
+    messages = [{"role": "assistant"}]
+    accumulator = StreamAccumulator(messages[-1])
+    for chunk in chunks:
+        accumulator.add(chunk)
+    messages[-1] = accumulator.materialize()
+    return messages[-1]
+
+
+def measure(replay, chunks: List[dict], repeat: int = 5):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        message = replay(chunks)
+        best = min(best, time.perf_counter() - start)
+    return best, message
+
+
+def main():
+    chunks = load_chunks(sys.argv[1]) if len(sys.argv) > 1 else generate_chunks()
+
+    merge_deltas_seconds, merged_message = measure(replay_merge_deltas, chunks)
+    accumulator_seconds, accumulated_message = measure(replay_accumulator, chunks)
+
+    assert merged_message == accumulated_message
+    print(f"chunks: {len(chunks)}, code length: {len(accumulated_message.get('code', ''))}")
+    print(f"merge_deltas: {merge_deltas_seconds * 1000:.1f}ms")
+    print(f"accumulator:  {accumulator_seconds * 1000:.1f}ms ({merge_deltas_seconds / accumulator_seconds:.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import re
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import requests
+
+from logging_conf import logger
+
+# Comma separated list of function runner endpoints. Cells of a batched code block are spread over them.
+FUNCTION_RUNNER_URLS = os.environ.get("FUNCTION_RUNNER_URLS", "http://localhost:8081").split(",")
+
+# Line that separates independent cells in a code block (same marker as Jupytext / VS Code cells)
+CELL_SEPARATOR_PATTERN = re.compile(r"^# %%.*$", re.MULTILINE)
+
+
+def call_function_runner(code: str, language: str, runner_url: str = FUNCTION_RUNNER_URLS[0]) -> str:
+    """
+    Calls the function runner, which runs code in a sandboxed environment.
+    """
+
+    # Send the code to the function runner
+    response = requests.post(f"{runner_url}/run/", json={"code": code, "language": language})
+
+    # Return the response
+    response = response.json()
+    logger.info(
+        {
+            "message": "Call function runner.",
+            "response": response,
+            "code": code,
+            "language": language,
+            "runner_url": runner_url,
+        }
+    )
+    return response["content"]
+
+
+def split_code_cells(code: str) -> List[str]:
+    """
+    Split code into independent cells delimited by `# %%` lines
+    :param code: code written by the LLM
+    :return: list of non-empty cells
+    """
+    cells = [cell.strip() for cell in CELL_SEPARATOR_PATTERN.split(code)]
+    return [cell for cell in cells if cell]
+
+
+def call_function_runners(codes: List[str], language: str, max_concurrency: int) -> List[str]:
+    """
+    Run independent code cells concurrently on the function runner pool
+    :param codes: list of code cells
+    :param language: language of the code cells
+    :param max_concurrency: max number of cells running at the same time
+    :return: list of outputs, in the same order as codes
+    """
+
+    def run_cell(index: int, code: str) -> str:
+        runner_url = FUNCTION_RUNNER_URLS[index % len(FUNCTION_RUNNER_URLS)]
+        try:
+            return call_function_runner(code, language, runner_url)
+        except Exception:
+            # One failing cell should not hide the outputs of the others
+            return traceback.format_exc().strip()
+
+    max_workers = max(1, min(max_concurrency, len(codes)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(run_cell, index, code) for index, code in enumerate(codes)]
+        outputs = [future.result() for future in futures]
+
+    logger.info(
+        {
+            "message": "Call function runners.",
+            "cells": len(codes),
+            "max_workers": max_workers,
+            "language": language,
+        }
+    )
+    return outputs
+
+
+def merge_cell_outputs(outputs: List[str]) -> str:
+    """
+    Merge outputs of code cells into a single output, keeping the cell order
+    :param outputs: list of outputs returned by call_function_runners
+    :return: merged output
+    """
+    return "\n\n".join(f"[Cell {index + 1}]\n{output or 'No output'}" for index, output in enumerate(outputs))
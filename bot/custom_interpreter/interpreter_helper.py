@@ -2,6 +2,7 @@ from typing import List
 
 from interpreter.core.core import Interpreter
 from custom_interpreter.utils import (
+    generate_parallel_code_blocks_message,
     generate_system_message,
     load_messages_json,
     save_messages_json,
@@ -13,13 +14,24 @@ from custom_interpreter.respond_hepler import respond
 
 class OpenInterpreterHelper(Interpreter):
     temp_dir_path: str
+    parallel_code_blocks: bool
+    max_concurrent_runs: int
 
-    def __init__(self, temp_dir_path: str):
+    def __init__(
+        self,
+        temp_dir_path: str,
+        parallel_code_blocks: bool = False,
+        max_concurrent_runs: int = 4,
+    ):
         super().__init__()
         self.temp_dir_path = temp_dir_path
+        self.parallel_code_blocks = parallel_code_blocks
+        self.max_concurrent_runs = max_concurrent_runs
         self.auto_run = True
         self.messages = load_messages_json(temp_dir_path)
         self.system_message += generate_system_message(temp_dir_path)
+        if parallel_code_blocks:
+            self.system_message += generate_parallel_code_blocks_message()
 
     def _respond(self):
         yield from respond(self)
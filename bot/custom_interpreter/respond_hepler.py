@@ -1,34 +1,15 @@
-import requests
-
-from interpreter.utils.merge_deltas import merge_deltas
 from interpreter.utils.display_markdown_message import display_markdown_message
 from interpreter.utils.truncate_output import truncate_output
 import traceback
 import litellm
 from logging_conf import logger
-
-
-def call_function_runner(code: str, language: str) -> str:
-    """
-    Calls the function runner, which runs code in a sandboxed environment.
-    """
-
-    # Send the code to the function runner
-    response = requests.post(
-        "http://localhost:8081/run/", json={"code": code, "language": language}
-    )
-
-    # Return the response
-    response = response.json()
-    logger.info(
-        {
-            "message": "Call function runner.",
-            "response": response,
-            "code": code,
-            "language": language,
-        }
-    )
-    return response["content"]
+from custom_interpreter.function_runner import (
+    call_function_runner,
+    call_function_runners,
+    merge_cell_outputs,
+    split_code_cells,
+)
+from custom_interpreter.stream_accumulator import StreamAccumulator
 
 
 def respond(interpreter):
@@ -45,13 +26,12 @@ def respond(interpreter):
         system_message = {"role": "system", "message": system_message}
 
         # Create the version of messages that we'll send to the LLM
-        messages_for_llm = interpreter.messages.copy()
-        messages_for_llm = [system_message] + messages_for_llm
-
         # It's best to explicitly tell these LLMs when they don't get an output
-        for message in messages_for_llm:
-            if "output" in message and message["output"] == "":
-                message["output"] = "No output"
+        # (Only the LLM's copy is changed, interpreter.messages keeps the original output)
+        messages_for_llm = [system_message] + [
+            {**message, "output": "No output"} if message.get("output") == "" else message
+            for message in interpreter.messages
+        ]
 
         ### RUN THE LLM ###
 
@@ -61,39 +41,16 @@ def respond(interpreter):
 
         # Start putting chunks into the new message
         # + yielding chunks to the user
+        # The chunks are buffered and the message is materialized once the LLM stops streaming
+        accumulator = StreamAccumulator(interpreter.messages[-1])
         try:
-            # Track the type of chunk that the coding LLM is emitting
-            chunk_type = None
-
             for chunk in interpreter._llm(messages_for_llm):
-                # Add chunk to the last message
-                interpreter.messages[-1] = merge_deltas(interpreter.messages[-1], chunk)
-
                 # This is a coding llm
                 # It will yield dict with either a message, language, or code (or language AND code)
 
                 # We also want to track which it's sending to we can send useful flags.
                 # (otherwise pretty much everyone needs to implement this)
-                if "message" in chunk and chunk_type != "message":
-                    chunk_type = "message"
-                    yield {"start_of_message": True}
-                elif "language" in chunk and chunk_type != "code":
-                    chunk_type = "code"
-                    yield {"start_of_code": True}
-                if "code" in chunk and chunk_type != "code":
-                    # (This shouldn't happen though — ^ "language" should be emitted first)
-                    chunk_type = "code"
-                    yield {"start_of_code": True}
-                elif "message" not in chunk and chunk_type == "message":
-                    chunk_type = None
-                    yield {"end_of_message": True}
-                elif (
-                    "code" not in chunk
-                    and "language" not in chunk
-                    and chunk_type == "code"
-                ):
-                    chunk_type = None
-                    yield {"end_of_code": True}
+                yield from accumulator.add(chunk)
 
                 yield chunk
         except litellm.exceptions.BudgetExceededError:
@@ -117,6 +74,8 @@ def respond(interpreter):
                 )
             else:
                 raise
+        finally:
+            interpreter.messages[-1] = accumulator.materialize()
 
         ### RUN CODE (if it's there) ###
 
@@ -140,8 +99,16 @@ def respond(interpreter):
                 language = interpreter.messages[-1]["language"]
 
                 # Run the code
-                output = call_function_runner(code, language)
-                output = truncate_output(output, interpreter.max_output)
+                # In batched mode, independent cells of the block run concurrently on the runner pool
+                cells = split_code_cells(code) if interpreter.parallel_code_blocks else [code]
+                if len(cells) > 1:
+                    outputs = call_function_runners(cells, language, interpreter.max_concurrent_runs)
+                    # Truncate each cell, so that a verbose cell does not push the others out of the output
+                    max_cell_output = interpreter.max_output // len(outputs)
+                    output = merge_cell_outputs([truncate_output(output, max_cell_output) for output in outputs])
+                else:
+                    output = call_function_runner(code, language)
+                    output = truncate_output(output, interpreter.max_output)
                 interpreter.messages[-1]["output"] = output
 
                 # if language not in interpreter._code_interpreters:
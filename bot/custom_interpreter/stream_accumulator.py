@@ -0,0 +1,68 @@
+from typing import Dict, List, Optional
+
+from interpreter.utils.merge_deltas import merge_deltas
+
+
+class StreamAccumulator:
+    """
+    Accumulates streamed chunks of one assistant message.
+    String fields are buffered as lists of chunks and joined once in materialize(),
+    instead of rebuilding the message with merge_deltas for every chunk.
+    """
+
+    message: dict
+    chunk_type: Optional[str]
+
+    def __init__(self, message: dict):
+        self.message = message
+        self.chunk_type = None
+        self._buffers: Dict[str, List[str]] = {}
+
+    def add(self, chunk: dict) -> List[dict]:
+        """
+        Add chunk to the buffers
+        :param chunk: chunk emitted by the coding LLM
+        :return: list of flags (start_of_message, end_of_code, ...) to yield before the chunk
+        """
+        for key, value in chunk.items():
+            if isinstance(value, str):
+                self._buffers.setdefault(key, []).append(value)
+            else:
+                merge_deltas(self.message, {key: value})
+        return self._transition(chunk)
+
+    def _transition(self, chunk: dict) -> List[dict]:
+        """
+        Track which type of chunk the coding LLM is emitting (None -> "message" / "code" -> None)
+        :param chunk: chunk emitted by the coding LLM
+        :return: list of flags for the transition
+        """
+        flags = []
+        if "message" in chunk and self.chunk_type != "message":
+            self.chunk_type = "message"
+            flags.append({"start_of_message": True})
+        elif "language" in chunk and self.chunk_type != "code":
+            self.chunk_type = "code"
+            flags.append({"start_of_code": True})
+        if "code" in chunk and self.chunk_type != "code":
+            # (This shouldn't happen though — ^ "language" should be emitted first)
+            self.chunk_type = "code"
+            flags.append({"start_of_code": True})
+        elif "message" not in chunk and self.chunk_type == "message":
+            self.chunk_type = None
+            flags.append({"end_of_message": True})
+        elif "code" not in chunk and "language" not in chunk and self.chunk_type == "code":
+            self.chunk_type = None
+            flags.append({"end_of_code": True})
+        return flags
+
+    def materialize(self) -> dict:
+        """
+        Join the buffered chunks into the message
+        :return: accumulated message
+        """
+        for key, parts in self._buffers.items():
+            value = "".join(parts)
+            self.message[key] = self.message[key] + value if key in self.message else value
+        self._buffers = {}
+        return self.message
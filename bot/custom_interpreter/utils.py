@@ -40,6 +40,14 @@ You can use the following libraries without installing:
 """
 
 
+def generate_parallel_code_blocks_message() -> str:
+    return """
+When a code block contains steps that do not depend on each other (e.g. loading several files, parameter sweeps),
+separate them with a `# %%` line. Each cell runs concurrently in a new session, so cells must not share variables.
+The output of each cell is returned as `[Cell N]` in the same order.
+"""
+
+
 def load_messages_json(temp_dir_path: str) -> List[dict]:
     """
     Read messages history from temp directory
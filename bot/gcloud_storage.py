@@ -1,9 +1,32 @@
 import fnmatch
+import json
 import os
-from typing import List
+import tempfile
+import uuid
+from typing import Dict, List, Optional
 
+from google.api_core.exceptions import NotFound, PreconditionFailed
 from google.cloud import storage
 
+from workspace_snapshot import (
+    build_snapshot_index,
+    diff_snapshot_index,
+    extract_snapshot,
+    get_safe_relative_path,
+    write_snapshot_layer,
+)
+
+# Workspace snapshot: a single object made of appended layers (see workspace_snapshot.py)
+SNAPSHOT_BLOB_NAME = "snapshot.tar.gz"
+SNAPSHOT_LAYER_BLOB_PREFIX = "snapshot.layer-"
+SNAPSHOT_INDEX_FILE_SUFFIX = ".snapshot_index.json"
+# Superseded file versions stay in older layers, so rewrite the snapshot after this many layers
+SNAPSHOT_MAX_LAYERS = 8
+# Number of attempts when another request changes the snapshot during an upload
+SNAPSHOT_MAX_ATTEMPTS = 3
+# Snapshots smaller than this are downloaded to memory, larger ones spill to disk
+SNAPSHOT_SPOOL_MAX_SIZE = 32 * 1024 * 1024
+
 
 def get_ignore_patterns(ignore_file_path):
     """
@@ -52,8 +75,16 @@ def download_files_from_bucket(bucket_name: str, destination_dir_path: str, blob
 
     # Loop through the blobs (files) and download them
     for blob in bucket.list_blobs(prefix=blob_prefix):
-        file_name = os.path.basename(blob.name)
-        destination_file_path = os.path.join(destination_dir_path, file_name)
+        relative_path = get_safe_relative_path(blob.name[len(blob_prefix):])
+        if (
+            blob.name.endswith("/")
+            or relative_path is None
+            or relative_path == SNAPSHOT_BLOB_NAME
+            or relative_path.startswith(SNAPSHOT_LAYER_BLOB_PREFIX)
+        ):
+            continue
+        destination_file_path = os.path.join(destination_dir_path, relative_path)
+        os.makedirs(os.path.dirname(destination_file_path), exist_ok=True)
         blob.download_to_filename(destination_file_path)
         file_paths.append(destination_file_path)
     return file_paths
@@ -93,3 +124,172 @@ def upload_files_to_bucket(local_directory_path: str, bucket_name: str, blob_pre
 
             # Upload the file
             blob.upload_from_filename(source_file_path)
+
+
+def get_snapshot_index_path(local_directory_path: str) -> str:
+    """
+    Get path of the local snapshot state (next to the workspace, not inside it)
+    :param local_directory_path: workspace directory path
+    :return: path of snapshot state file
+    """
+    return os.path.normpath(local_directory_path) + SNAPSHOT_INDEX_FILE_SUFFIX
+
+
+def save_snapshot_state(local_directory_path: str, generation: Optional[int], index: Dict[str, List[int]]):
+    """
+    Save the generation of the snapshot and the index of the workspace it matches
+    :param local_directory_path: workspace directory path
+    :param generation: generation of the snapshot blob, or None if the workspace does not match it
+    :param index: index of the workspace
+    """
+    with open(get_snapshot_index_path(local_directory_path), "w") as f:
+        json.dump({"generation": generation, "index": index}, f)
+
+
+def restore_workspace_snapshot(bucket_name: str, destination_dir_path: str, blob_prefix: str) -> Optional[List[str]]:
+    """
+    Restore workspace from its snapshot in GCS bucket with a single streaming download
+    :param bucket_name: bucket name to download
+    :param destination_dir_path: directory path to save files
+    :param blob_prefix: prefix of snapshot blob
+    :return: list of restored file paths, or None if the snapshot does not exist
+    """
+    # Initialize the Cloud Storage client
+    storage_client = storage.Client()
+
+    if not os.path.exists(destination_dir_path):
+        os.makedirs(destination_dir_path)
+
+    # Check if the bucket exists
+    if not storage_client.lookup_bucket(bucket_name):
+        storage_client.create_bucket(bucket_name)
+        return []
+
+    # Get the bucket
+    bucket = storage_client.get_bucket(bucket_name)
+
+    snapshot_blob = bucket.get_blob(blob_prefix + SNAPSHOT_BLOB_NAME)
+    if snapshot_blob is None:
+        return None
+
+    # Stream the whole snapshot in one request
+    with tempfile.SpooledTemporaryFile(max_size=SNAPSHOT_SPOOL_MAX_SIZE) as snapshot_file:
+        snapshot_blob.download_to_file(snapshot_file, if_generation_match=snapshot_blob.generation)
+        snapshot_file.seek(0)
+        index = extract_snapshot(snapshot_file, destination_dir_path)
+
+    save_snapshot_state(destination_dir_path, snapshot_blob.generation, index)
+
+    return [os.path.join(destination_dir_path, relative_path) for relative_path in index]
+
+
+def upload_workspace_snapshot(local_directory_path: str, bucket_name: str, blob_prefix: str):
+    """
+    Upload files changed since the last restore as a layer appended to the workspace snapshot
+    :param local_directory_path: directory path to upload files in cloud run
+    :param bucket_name: bucket name to upload
+    :param blob_prefix: prefix of snapshot blob
+    """
+    # Initialize the Cloud Storage client
+    storage_client = storage.Client()
+
+    # Get the bucket
+    bucket = storage_client.get_bucket(bucket_name)
+
+    # Check if the directory exists
+    if not os.path.exists(local_directory_path):
+        return
+
+    index = build_snapshot_index(local_directory_path, get_ignore_patterns("../.gitignore"))
+
+    previous_index = {}
+    previous_generation = None
+    index_path = get_snapshot_index_path(local_directory_path)
+    if os.path.exists(index_path):
+        with open(index_path, "r") as f:
+            snapshot_state = json.load(f)
+        previous_index = snapshot_state["index"]
+        previous_generation = snapshot_state["generation"]
+
+    changed_paths, deleted_paths = diff_snapshot_index(index, previous_index)
+    if not changed_paths and not deleted_paths:
+        return
+
+    for _ in range(SNAPSHOT_MAX_ATTEMPTS):
+        snapshot_blob = bucket.get_blob(blob_prefix + SNAPSHOT_BLOB_NAME)
+
+        # The workspace can only replace the snapshot it was restored from,
+        # otherwise files added by another request would be lost
+        is_own_base = snapshot_blob is not None and snapshot_blob.generation == previous_generation
+        if snapshot_blob is None:
+            generation = rewrite_snapshot(bucket, blob_prefix, local_directory_path, index, 0)
+        elif is_own_base and (snapshot_blob.component_count or 1) >= SNAPSHOT_MAX_LAYERS:
+            generation = rewrite_snapshot(bucket, blob_prefix, local_directory_path, index, snapshot_blob.generation)
+        else:
+            # Layers are applied file by file, so a delta can also go on top of another request's changes
+            generation = append_snapshot_layer(
+                bucket, snapshot_blob, local_directory_path, changed_paths, deleted_paths
+            )
+
+        if generation is not None:
+            # On top of another request's changes, the workspace no longer matches the snapshot,
+            # so it must be restored again before it can replace the snapshot
+            is_own_snapshot = snapshot_blob is None or is_own_base
+            save_snapshot_state(local_directory_path, generation if is_own_snapshot else None, index)
+            return
+
+    raise RuntimeError(f"Snapshot {blob_prefix + SNAPSHOT_BLOB_NAME} in {bucket_name} kept changing during upload.")
+
+
+def rewrite_snapshot(
+    bucket, blob_prefix: str, local_directory_path: str, index: Dict[str, List[int]], if_generation_match: int
+) -> Optional[int]:
+    """
+    Replace the snapshot with a single layer of the whole workspace
+    :param bucket: bucket of the snapshot
+    :param blob_prefix: prefix of snapshot blob
+    :param local_directory_path: workspace directory path
+    :param index: index of the whole workspace
+    :param if_generation_match: generation of the snapshot to replace (0 if it does not exist)
+    :return: generation of the new snapshot, or None if the snapshot was changed by another request
+    """
+    snapshot_blob = bucket.blob(blob_prefix + SNAPSHOT_BLOB_NAME)
+    with tempfile.TemporaryFile() as layer_file:
+        write_snapshot_layer(layer_file, local_directory_path, list(index), [])
+        layer_file.seek(0)
+        try:
+            snapshot_blob.upload_from_file(layer_file, if_generation_match=if_generation_match)
+        except PreconditionFailed:
+            return None
+    return snapshot_blob.generation
+
+
+def append_snapshot_layer(
+    bucket, snapshot_blob, local_directory_path: str, changed_paths: List[str], deleted_paths: List[str]
+) -> Optional[int]:
+    """
+    Append a layer of changed files to the snapshot on the server side
+    :param bucket: bucket of the snapshot
+    :param snapshot_blob: snapshot blob to append to
+    :param local_directory_path: workspace directory path
+    :param changed_paths: relative paths of changed files
+    :param deleted_paths: relative paths of deleted files
+    :return: generation of the new snapshot, or None if the snapshot was changed by another request
+    """
+    blob_prefix = snapshot_blob.name[: -len(SNAPSHOT_BLOB_NAME)]
+    layer_blob = bucket.blob(f"{blob_prefix}{SNAPSHOT_LAYER_BLOB_PREFIX}{uuid.uuid4().hex}.tar.gz")
+    with tempfile.TemporaryFile() as layer_file:
+        write_snapshot_layer(layer_file, local_directory_path, changed_paths, deleted_paths)
+        layer_file.seek(0)
+        layer_blob.upload_from_file(layer_file)
+
+    try:
+        snapshot_blob.compose([snapshot_blob, layer_blob], if_generation_match=snapshot_blob.generation)
+        return snapshot_blob.generation
+    except PreconditionFailed:
+        return None
+    finally:
+        try:
+            layer_blob.delete()
+        except NotFound:
+            pass
@@ -15,6 +15,9 @@ from utils import get_temp_dir
 app = Flask(__name__)
 slack_app = App(token=os.environ["SLACK_BOT_TOKEN"], signing_secret=os.environ["SLACK_SIGNING_SECRET"])
 handler = SlackRequestHandler(slack_app)
+workspace_snapshot = os.environ.get("WORKSPACE_SNAPSHOT", "false").lower() == "true"
+parallel_code_blocks = os.environ.get("PARALLEL_CODE_BLOCKS", "false").lower() == "true"
+max_concurrent_runs = int(os.environ.get("MAX_CONCURRENT_RUNS", "4"))
 
 
 @app.route("/slack/events", methods=["POST"])
@@ -45,7 +48,12 @@ def mentioned(body, say: Say):
         temp_dir = get_temp_dir(parent_message_user_id, thread_ts)
         bucket_name = gcloud_storage.get_bucket_name(parent_message_user_id)
         os.makedirs(temp_dir, exist_ok=True)
-        loaded_file_paths = gcloud_storage.download_files_from_bucket(bucket_name, temp_dir, thread_ts + "/")
+        loaded_file_paths = None
+        if workspace_snapshot:
+            loaded_file_paths = gcloud_storage.restore_workspace_snapshot(bucket_name, temp_dir, thread_ts + "/")
+        if loaded_file_paths is None:
+            # Threads saved before snapshots were enabled are still loose objects
+            loaded_file_paths = gcloud_storage.download_files_from_bucket(bucket_name, temp_dir, thread_ts + "/")
 
         logger.info(
             {
@@ -79,13 +87,16 @@ def mentioned(body, say: Say):
             logger.info({"message": "Empty message."})
             return
 
-        interpreter = OpenInterpreterHelper(temp_dir)
+        interpreter = OpenInterpreterHelper(temp_dir, parallel_code_blocks, max_concurrent_runs)
         previous_messages_length = len(interpreter.messages)
         messages = interpreter.chat_and_save_messages_json(message_by_user)
         new_messages = messages[previous_messages_length:]
         display_message = convert_interpreter_responses_to_slack_message(new_messages)
 
-        gcloud_storage.upload_files_to_bucket(temp_dir, bucket_name, thread_ts + "/")
+        if workspace_snapshot:
+            gcloud_storage.upload_workspace_snapshot(temp_dir, bucket_name, thread_ts + "/")
+        else:
+            gcloud_storage.upload_files_to_bucket(temp_dir, bucket_name, thread_ts + "/")
         say(text=display_message, thread_ts=thread_ts)
     except Exception as e:
         logger.error({"message": "Error occurred.", "error": e})
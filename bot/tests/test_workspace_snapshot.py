@@ -0,0 +1,103 @@
+import io
+import os
+import tarfile
+
+import pytest
+
+import workspace_snapshot
+from workspace_snapshot import (
+    build_snapshot_index,
+    diff_snapshot_index,
+    extract_snapshot,
+    get_safe_relative_path,
+    write_snapshot_layer,
+)
+
+
+def write_text(path, text: str, mtime: int):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text)
+    os.utime(path, (mtime, mtime))
+
+
+def pack_layer(workspace, changed_paths, deleted_paths) -> bytes:
+    layer_file = io.BytesIO()
+    write_snapshot_layer(layer_file, str(workspace), changed_paths, deleted_paths)
+    return layer_file.getvalue()
+
+
+@pytest.fixture
+def workspace(tmp_path):
+    workspace = tmp_path / "workspace"
+    write_text(workspace / "messages.json", "[]", 1000)
+    write_text(workspace / "a" / "data.csv", "x\n1\n", 1000)
+    write_text(workspace / "b" / "data.csv", "y\n2\n", 1000)
+    write_text(workspace / "old.png", "png", 1000)
+    return workspace
+
+
+def test_layers_round_trip(tmp_path, workspace):
+    first_index = build_snapshot_index(str(workspace), [])
+    snapshot = pack_layer(workspace, list(first_index), [])
+
+    write_text(workspace / "messages.json", '[{"role": "user"}]', 2000)
+    os.remove(workspace / "old.png")
+    write_text(workspace / "a" / "nested" / "chart.png", "chart", 2000)
+    second_index = build_snapshot_index(str(workspace), [])
+    changed_paths, deleted_paths = diff_snapshot_index(second_index, first_index)
+    assert sorted(changed_paths) == [os.path.join("a", "nested", "chart.png"), "messages.json"]
+    assert deleted_paths == ["old.png"]
+    snapshot += pack_layer(workspace, changed_paths, deleted_paths)
+
+    destination = tmp_path / "restored"
+    index = extract_snapshot(io.BytesIO(snapshot), str(destination))
+
+    assert index == second_index
+    assert build_snapshot_index(str(destination), []) == second_index
+    assert (destination / "messages.json").read_text() == '[{"role": "user"}]'
+    assert (destination / "a" / "data.csv").read_text() == "x\n1\n"
+    assert (destination / "b" / "data.csv").read_text() == "y\n2\n"
+    assert not (destination / "old.png").exists()
+
+
+def test_large_files_are_streamed(tmp_path, workspace, monkeypatch):
+    monkeypatch.setattr(workspace_snapshot, "SNAPSHOT_MAX_POOLED_FILE_SIZE", 3)
+    index = build_snapshot_index(str(workspace), [])
+    snapshot = pack_layer(workspace, list(index), [])
+
+    destination = tmp_path / "restored"
+    assert extract_snapshot(io.BytesIO(snapshot), str(destination)) == index
+    assert (destination / "a" / "data.csv").read_text() == "x\n1\n"
+
+
+def test_members_outside_workspace_are_skipped(tmp_path):
+    snapshot_file = io.BytesIO()
+    with tarfile.open(fileobj=snapshot_file, mode="w:gz") as tar:
+        for name in ["../escaped.txt", "/tmp/absolute.txt", "..cache"]:
+            info = tarfile.TarInfo(name)
+            info.size = 4
+            tar.addfile(info, io.BytesIO(b"data"))
+    snapshot_file.seek(0)
+
+    destination = tmp_path / "restored"
+    index = extract_snapshot(snapshot_file, str(destination))
+
+    assert list(index) == ["..cache"]
+    assert (destination / "..cache").read_text() == "data"
+    assert not (tmp_path / "escaped.txt").exists()
+
+
+@pytest.mark.parametrize(
+    "path, expected",
+    [
+        ("a/b.csv", os.path.join("a", "b.csv")),
+        ("a/../b.csv", "b.csv"),
+        ("..cache", "..cache"),
+        ("..", None),
+        ("../b.csv", None),
+        ("a/../../b.csv", None),
+        ("/b.csv", None),
+    ],
+)
+def test_get_safe_relative_path(path, expected):
+    assert get_safe_relative_path(path) == expected
@@ -0,0 +1,149 @@
+import fnmatch
+import gzip
+import io
+import json
+import os
+import shutil
+import tarfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+# Workspace snapshot: gzip-compressed tar layers appended to each other
+# Each layer holds the files changed since the layer it was computed against, plus the list of deleted files.
+# Layers are applied in order, so the last layer that wrote or deleted a file wins.
+SNAPSHOT_DELETED_MEMBER_NAME = ".snapshot_deleted.json"
+SNAPSHOT_EXTRACT_WORKERS = 8
+# Files larger than this are streamed to disk by the reader instead of being buffered for the writer pool
+SNAPSHOT_MAX_POOLED_FILE_SIZE = 1024 * 1024
+# Max number of small files held in memory while waiting to be written
+SNAPSHOT_MAX_PENDING_WRITES = 32
+
+
+def get_safe_relative_path(path: str) -> Optional[str]:
+    """
+    Normalize a path relative to the workspace, rejecting paths that escape it
+    :param path: path relative to the workspace
+    :return: normalized relative path, or None if it is absolute or outside of the workspace
+    """
+    relative_path = os.path.normpath(path)
+    if os.path.isabs(relative_path) or relative_path == ".." or relative_path.startswith(".." + os.sep):
+        return None
+    return relative_path
+
+
+def build_snapshot_index(local_directory_path: str, ignore_patterns: List[str]) -> Dict[str, List[int]]:
+    """
+    Build index of the workspace
+    :param local_directory_path: workspace directory path
+    :param ignore_patterns: file name patterns to skip
+    :return: dict of relative path to [mtime, size]
+    """
+    index = {}
+    for root, _, files in os.walk(local_directory_path):
+        for filename in files:
+            if any(fnmatch.fnmatch(filename, pattern) for pattern in ignore_patterns):
+                continue
+
+            source_file_path = os.path.join(root, filename)
+            relative_path = os.path.relpath(source_file_path, local_directory_path)
+            if relative_path == SNAPSHOT_DELETED_MEMBER_NAME:
+                continue
+
+            stat = os.stat(source_file_path)
+            index[relative_path] = [int(stat.st_mtime), stat.st_size]
+    return index
+
+
+def diff_snapshot_index(index: Dict[str, List[int]], previous_index: Dict[str, List[int]]):
+    """
+    Compare the workspace with the index it was restored from
+    :param index: current index of the workspace
+    :param previous_index: index of the workspace when it was restored
+    :return: tuple of changed relative paths and deleted relative paths
+    """
+    changed_paths = [path for path, stat in index.items() if previous_index.get(path) != stat]
+    deleted_paths = [path for path in previous_index if path not in index]
+    return changed_paths, deleted_paths
+
+
+def write_snapshot_layer(layer_file, local_directory_path: str, changed_paths: List[str], deleted_paths: List[str]):
+    """
+    Write a snapshot layer (gzip-compressed tar) to layer_file
+    :param layer_file: binary file object to write the layer
+    :param local_directory_path: workspace directory path
+    :param changed_paths: relative paths of files to pack
+    :param deleted_paths: relative paths of files deleted since the previous layer
+    """
+    with tarfile.open(fileobj=layer_file, mode="w:gz") as tar:
+        for relative_path in changed_paths:
+            tar.add(os.path.join(local_directory_path, relative_path), arcname=relative_path)
+
+        deleted_json = json.dumps(deleted_paths).encode("utf-8")
+        deleted_info = tarfile.TarInfo(SNAPSHOT_DELETED_MEMBER_NAME)
+        deleted_info.size = len(deleted_json)
+        tar.addfile(deleted_info, io.BytesIO(deleted_json))
+
+
+def extract_snapshot(snapshot_file, destination_dir_path: str) -> Dict[str, List[int]]:
+    """
+    Extract all layers of a snapshot, writing small files in parallel
+    :param snapshot_file: binary file object to read the snapshot
+    :param destination_dir_path: directory path to extract files
+    :return: index of the restored workspace
+    """
+    pending_writes = threading.BoundedSemaphore(SNAPSHOT_MAX_PENDING_WRITES)
+
+    def write_file(destination_file_path: str, content: bytes, mtime: int):
+        try:
+            with open(destination_file_path, "wb") as f:
+                f.write(content)
+            os.utime(destination_file_path, (mtime, mtime))
+        finally:
+            pending_writes.release()
+
+    index = {}
+    futures: Dict[str, Future] = {}
+    # Concatenated gzip members are read by GzipFile as one stream, and ignore_zeros skips the end of each tar
+    with gzip.GzipFile(fileobj=snapshot_file, mode="rb") as gzip_file, tarfile.open(
+        fileobj=gzip_file, mode="r|", ignore_zeros=True
+    ) as tar, ThreadPoolExecutor(max_workers=SNAPSHOT_EXTRACT_WORKERS) as executor:
+        for member in tar:
+            if member.name == SNAPSHOT_DELETED_MEMBER_NAME:
+                for deleted_path in json.load(tar.extractfile(member)):
+                    relative_path = get_safe_relative_path(deleted_path)
+                    if relative_path is None:
+                        continue
+                    if relative_path in futures:
+                        futures.pop(relative_path).result()
+                    destination_file_path = os.path.join(destination_dir_path, relative_path)
+                    if os.path.exists(destination_file_path):
+                        os.remove(destination_file_path)
+                    index.pop(relative_path, None)
+                continue
+
+            relative_path = get_safe_relative_path(member.name)
+            if not member.isfile() or relative_path is None:
+                continue
+
+            # A later layer overrides the file, so wait for the previous write of the same path
+            if relative_path in futures:
+                futures.pop(relative_path).result()
+            destination_file_path = os.path.join(destination_dir_path, relative_path)
+            os.makedirs(os.path.dirname(destination_file_path), exist_ok=True)
+            mtime = int(member.mtime)
+
+            if member.size > SNAPSHOT_MAX_POOLED_FILE_SIZE:
+                with open(destination_file_path, "wb") as f:
+                    shutil.copyfileobj(tar.extractfile(member), f)
+                os.utime(destination_file_path, (mtime, mtime))
+            else:
+                pending_writes.acquire()
+                content = tar.extractfile(member).read()
+                futures[relative_path] = executor.submit(write_file, destination_file_path, content, mtime)
+            index[relative_path] = [mtime, member.size]
+
+        for future in futures.values():
+            future.result()
+
+    return index